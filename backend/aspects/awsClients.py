@@ -0,0 +1,41 @@
+# boto3 clients and resources, built once per container so that warm
+# invocations reuse the same sessions and connection pools.
+
+import boto3
+from botocore.config import Config
+from functools import lru_cache
+from os import environ
+
+_CONFIG = Config(
+    max_pool_connections=50,
+    tcp_keepalive=True,
+    connect_timeout=5,
+    read_timeout=10,
+    retries={'mode': 'adaptive', 'total_max_attempts': 3}
+)
+
+
+@lru_cache(maxsize=None)
+def _resource(service: str):
+    return boto3.resource(service, config=_CONFIG)
+
+
+def get_dynamodb():
+    return _resource('dynamodb')
+
+
+@lru_cache(maxsize=None)
+def get_dynamodb_table(tableName: str):
+    " tableName is the environment variable holding the table's name "
+    return _resource('dynamodb').Table(environ[tableName])
+
+
+@lru_cache(maxsize=None)
+def get_sns_topic(topicArn: str):
+    " topicArn is the environment variable holding the topic's ARN "
+    return _resource('sns').Topic(environ[topicArn])
+
+
+@lru_cache(maxsize=None)
+def get_stepfunctions_client():
+    return boto3.client('stepfunctions', config=_CONFIG)
@@ -0,0 +1,23 @@
+# JSON encoding for messages going out on SNS and Step Functions.
+# orjson does this in C, but fall back to the stdlib if it's not installed.
+
+import json
+import decimal
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def _default(obj):
+    " DynamoDB hands numbers back as Decimal "
+    if isinstance(obj, decimal.Decimal):
+        return int(obj)
+    raise TypeError("Type is not JSON serializable: {}".format(type(obj).__name__))
+
+
+def dumps(obj) -> str:
+    if orjson is not None:
+        return orjson.dumps(obj, default=_default, option=orjson.OPT_NON_STR_KEYS).decode()
+    return json.dumps(obj, default=_default)
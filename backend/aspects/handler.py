@@ -1,5 +1,6 @@
 import json
 import logging
+from .thing import preload_aspects
 logging.getLogger().setLevel(logging.INFO)
 
 
@@ -11,8 +12,11 @@ logging.getLogger().setLevel(logging.INFO)
 
 
 def lambdaHandler(objectClass):
+    preload_aspects()
+
     def handler(event: dict, context: dict):
-        logging.info(json.dumps(event, indent=2))
+        if logging.getLogger().isEnabledFor(logging.INFO):
+            logging.info(json.dumps(event, indent=2))
         for e in event['Records']:
             objectClass._action(json.loads(e['Sns']['Message']))
     return handler
@@ -1,15 +1,39 @@
 # Land is locations on a grid with some terrain
 
+from .handler import lambdaHandler
 from .location import Location, ExitsType
-from .thing import IdType, callable
-from typing import Tuple
-import boto3
+from .thing import IdType, callable_action
+from .awsClients import get_dynamodb_table
+from typing import Callable, Dict, Tuple
 from boto3.dynamodb.conditions import Key
-from os import environ
 import ast
 
 CoordType = Tuple[int, int, int]
 
+_COORD_DELTAS: Dict[str, CoordType] = {
+    'north': (0, 1, 0),
+    'south': (0, -1, 0),
+    'west': (-1, 0, 0),
+    'east': (1, 0, 0),
+    'up': (0, 0, 1),
+    'down': (0, 0, -1)
+}
+_DELTA_TO_DIR: Dict[CoordType, str] = {delta: direction for direction, delta in _COORD_DELTAS.items()}
+
+
+def _make_dest(dx: int, dy: int, dz: int) -> Callable[[CoordType], CoordType]:
+    return lambda coordinates: (coordinates[0] + dx, coordinates[1] + dy, coordinates[2] + dz)
+
+
+# Builds the neighbouring coordinates in each direction, without a delta lookup and unpack per call
+_DEST_FN: Dict[str, Callable[[CoordType], CoordType]] = {
+    direction: _make_dest(*delta) for direction, delta in _COORD_DELTAS.items()
+}
+# The way back for each direction, eg. north -> south
+OPPOSITE: Dict[str, str] = {
+    direction: _DELTA_TO_DIR[(-dx, -dy, -dz)] for direction, (dx, dy, dz) in _COORD_DELTAS.items()
+}
+
 
 class Land(Location):
     _tableName = 'LAND_TABLE'
@@ -27,16 +51,17 @@ class Land(Location):
 
     @coordinates.setter
     def coordinates(self, value: CoordType):
-        self.data['coordinates'] = self._convertCoordinatesForStorage(value)
-        self._save()
+        self._update_attr('coordinates', self._convertCoordinatesForStorage(value))
 
     @classmethod
     def by_coordinates(cls, coordinates: CoordType) -> IdType:
         coords = cls._convertCoordinatesForStorage(coordinates)
-        queryResults = boto3.resource('dynamodb').Table(environ[cls._tableName]).query(
+        queryResults = get_dynamodb_table(cls._tableName).query(
             IndexName='cartesian',
-            Select='ALL_PROJECTED_ATTRIBUTES',
-            KeyConditionExpression=Key('coordinates').eq(coords)
+            ProjectionExpression='#uuid',
+            ExpressionAttributeNames={'#uuid': 'uuid'},
+            KeyConditionExpression=Key('coordinates').eq(coords),
+            Limit=1
         )
         if queryResults['Items']:
             return queryResults['Items'][0]['uuid']
@@ -46,30 +71,19 @@ class Land(Location):
 
     @classmethod
     def _new_coords_by_direction(cls, coordinates: CoordType, direction: str) -> CoordType:
-        exits = ['north', 'south', 'west', 'east', 'up', 'down']
-        assert(direction in exits)
-        new_coord = coordinates
-        if direction == 'north':
-            new_coord = (coordinates[0], coordinates[1]+1, coordinates[2])
-        elif direction == 'south':
-            new_coord = (coordinates[0], coordinates[1]-1, coordinates[2])
-        elif direction == 'west':
-            new_coord = (coordinates[0]-1, coordinates[1], coordinates[2])
-        elif direction == 'east':
-            new_coord = (coordinates[0]+1, coordinates[1], coordinates[2])
-        elif direction == 'up':
-            new_coord = (coordinates[0], coordinates[1], coordinates[2]+1)
-        elif direction == 'down':
-            new_coord = (coordinates[0], coordinates[1], coordinates[2]-1)
-        return new_coord
+        assert(direction in _DEST_FN)
+        return _DEST_FN[direction](coordinates)
 
     def by_direction(self, direction: str) -> IdType:
         new_coord = Land._new_coords_by_direction(self.coordinates, direction)
         return self.by_coordinates(new_coord)
 
-    @callable
+    @callable_action
     def add_exit(self, direction: str, destination: IdType) -> ExitsType:
         if not destination:
             new_coord = self._new_coords_by_direction(self.coordinates, direction)
             destination = Land.by_coordinates(new_coord)
         return super().add_exit(direction, destination)
+
+
+handler = lambdaHandler(Land)
@@ -1,4 +1,4 @@
-from aspects.thing import Thing, IdType, callable
+from aspects.thing import Thing, IdType, callable_action
 from boto3.dynamodb.conditions import Key
 from aspects.handler import lambdaHandler
 from typing import List, Dict, Optional
@@ -15,13 +15,13 @@ class Location(Thing):
     def exits(self) -> ExitsType:
         return self.data['exits']
 
-    @callable
+    @callable_action
     def add_exit(self, direction: str, destination: IdType) -> ExitsType:
         self.data['exits'][direction] = destination
         self._save()
         return self.data['exits']
 
-    @callable
+    @callable_action
     def remove_exit(self, direction: str) -> ExitsType:
         if direction in self.data['exits']:
             del(self.data['exits'][direction])
@@ -30,34 +30,41 @@ class Location(Thing):
 
     @property
     def contents(self) -> List[IdType]:
-        return [  # TODO: factor this out to deal with large response sets
-            item['uuid']
-            for item in self._table.query(
-                IndexName='contents',
-                Select='ALL_PROJECTED_ATTRIBUTES',
-                KeyConditionExpression=Key('location').eq(self.uuid)
-            )['Items']
-        ]
+        query = {
+            'IndexName': 'contents',
+            'ProjectionExpression': '#uuid',
+            'ExpressionAttributeNames': {'#uuid': 'uuid'},
+            'KeyConditionExpression': Key('location').eq(self.uuid)
+        }
+        contents = []
+        while True:
+            response = self._table.query(**query)
+            contents.extend(item['uuid'] for item in response['Items'])
+            if 'LastEvaluatedKey' not in response:
+                return contents
+            query['ExclusiveStartKey'] = response['LastEvaluatedKey']
 
     @property
     def location(self) -> Optional[IdType]:
-        return self.data['location']
+        return self.data.get('location')
 
     @location.setter
     def location(self, loc_id: IdType):
-        self.data['location'] = loc_id
-        self._save()
+        self._update_attr('location', loc_id)
 
-    @callable
+    @callable_action
     def create(self) -> None:
         self.data['exits'] = {}
         super().create()
 
-    @callable
+    @callable_action
     def destroy(self):
         dest = self.location or 'Nowhere'  # TODO: Figure out a better location for dropping objects
-        for item in self.contents:
-            Location(item, self.tid).location = dest
+        items = Location._batch_load(self.contents, self.tid)
+        for item in items:
+            item._deferSaves = True
+            item.location = dest
+        Location._flush_all(items)
         self._table.delete_item(Key={'uuid': self.uuid})
 
 
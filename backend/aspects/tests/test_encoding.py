@@ -0,0 +1,16 @@
+import unittest
+import json
+from decimal import Decimal
+from aspects import encoding
+
+
+class TestEncoding(unittest.TestCase):
+    def test_dumps_decimal(self):
+        self.assertEqual(json.loads(encoding.dumps({'tick_delay': Decimal(30)})), {'tick_delay': 30})
+
+    def test_dumps_non_str_keys(self):
+        self.assertEqual(json.loads(encoding.dumps({1: 'a'})), {'1': 'a'})
+
+    def test_dumps_unserializable(self):
+        with self.assertRaises(TypeError):
+            encoding.dumps({'obj': object()})
@@ -1,5 +1,6 @@
 import unittest
 from moto import mock_dynamodb2
+from aspects import land
 from aspects.land import Land
 from os import environ
 import boto3
@@ -114,6 +115,13 @@ class TestLand(unittest.TestCase):
         new_loc_uuid = Land.by_coordinates((0, 0, 0))
         self.assertEqual(loc_uuid, new_loc_uuid)
 
+    def test_new_coords_by_direction(self):
+        self.assertEqual(Land._new_coords_by_direction((1, 2, 3), 'down'), (1, 2, 2))
+        self.assertEqual(land.OPPOSITE['up'], 'down')
+        self.assertEqual(land.OPPOSITE['west'], 'east')
+        with self.assertRaises(AssertionError):
+            Land._new_coords_by_direction((0, 0, 0), 'sideways')
+
     def test_post_linkage(self):
         loc_uuid = Land.by_coordinates((0, 0, 0))
         north_loc_uuid = Land.by_coordinates((0, 1, 0))
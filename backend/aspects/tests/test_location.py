@@ -99,3 +99,21 @@ class TestLocation(unittest.TestCase):
         self.assertEqual(loc.location, second_container.uuid)
         self.assertEqual(first_container.contents, [])
         self.assertEqual(second_container.contents, [loc.uuid])
+
+    def test_clear_location(self):
+        loc = Location()
+        container = Location()
+        loc.location = container.uuid
+        loc.location = None
+        self.assertIsNone(Location(uuid=loc.uuid).location)
+        self.assertEqual(container.contents, [])
+
+    def test_destroy_moves_contents(self):
+        outside = Location()
+        room = Location()
+        room.location = outside.uuid
+        items = [Location() for _ in range(3)]
+        for item in items:
+            item.location = room.uuid
+        room.destroy()
+        self.assertEqual(sorted(outside.contents), sorted([item.uuid for item in items]))
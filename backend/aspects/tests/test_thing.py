@@ -1,5 +1,7 @@
 import unittest
 from moto import mock_dynamodb2, mock_sns, mock_stepfunctions, mock_iam
+from unittest import mock
+import json
 import boto3
 from aspects import thing
 from os import environ
@@ -8,6 +10,20 @@ from os import environ
 class ThingTestClass(thing.Thing):
     _tableName = 'testing'
 
+    @thing.callable_action
+    def pay_and_fail(self) -> None:
+        self.data['gold'] = 100
+        self._save()
+        thing.Call(self.tid, self.uuid, self.uuid, self.aspectName, 'paid').now()
+        raise RuntimeError('failed after paying')
+
+    @thing.callable_action
+    def rename(self, name: str) -> None:
+        self.data['name'] = name
+        self._save()
+        self.data['renamed'] = True
+        self._save()
+
 
 environ['testing'] = 'test_table'
 environ['MESSAGE_DELAYER_ARN'] = 'test'
@@ -106,12 +122,77 @@ Version: "2012-10-17"
         with self.assertRaises(KeyError):
             t = ThingTestClass(uuid, 'tid2')
 
-    # def test_tick(self):
-    #     self._createTestTable()
-    #     self._createTestSFN()
-    #     t = ThingTestClass('', 'tid')
-    #     t.tick()
-    #     # TODO: Check that it self-scheduled
+    def test_action_destroy_not_resaved(self):
+        t = ThingTestClass('', 'tid')
+        uuid = t.uuid
+        ThingTestClass._action({'action': 'destroy', 'uuid': uuid, 'tid': 'tid'})
+        with self.assertRaises(KeyError):
+            ThingTestClass(uuid, 'tid2')
+
+    def test_action_saves_once(self):
+        t = ThingTestClass('', 'tid')
+        with mock.patch.object(t._table, 'put_item', wraps=t._table.put_item) as put_item:
+            ThingTestClass._action({'action': 'rename', 'uuid': t.uuid, 'tid': 'tid', 'data': {'name': 'bob'}})
+        self.assertEqual(put_item.call_count, 1)
+        loaded = ThingTestClass(t.uuid, 'tid')
+        self.assertEqual(loaded.data['name'], 'bob')
+        self.assertTrue(loaded.data['renamed'])
+
+    def test_action_error_drops_saves_and_publishes(self):
+        t = ThingTestClass('', 'tid')
+        with mock.patch.object(thing, 'get_sns_topic') as topic:
+            with self.assertRaises(RuntimeError):
+                ThingTestClass._action({'action': 'pay_and_fail', 'uuid': t.uuid, 'tid': 'tid'})
+        topic.return_value.meta.client.publish_batch.assert_not_called()
+        topic.return_value.publish.assert_not_called()
+        self.assertNotIn('gold', ThingTestClass(t.uuid, 'tid').data)
+
+    def test_action_batches_callback(self):
+        t = ThingTestClass('', 'tid')
+        with mock.patch.object(thing, 'get_sns_topic') as topic:
+            topic.return_value.meta.client.publish_batch.return_value = {'Successful': []}
+            ThingTestClass._action({
+                'action': 'destroy', 'uuid': t.uuid, 'tid': 'tid',
+                'callback': {'tid': 'tid', 'aspect': 'Other', 'action': 'done', 'uuid': 'origin', 'data': {}}
+            })
+        topic.return_value.publish.assert_not_called()
+        entries = topic.return_value.meta.client.publish_batch.call_args[1]['PublishBatchRequestEntries']
+        self.assertEqual(len(entries), 1)
+        self.assertEqual(json.loads(entries[0]['Message'])['action'], 'done')
+
+    def test_batch_load_retries_unprocessed(self):
+        t = ThingTestClass('', 'tid')
+        tableName = environ['testing']
+        responses = [
+            {'Responses': {}, 'UnprocessedKeys': {tableName: {'Keys': [{'uuid': t.uuid}]}}},
+            {'Responses': {tableName: [{'uuid': t.uuid}]}}
+        ]
+        with mock.patch.object(thing, 'get_dynamodb') as dynamodb, mock.patch.object(thing.time, 'sleep') as sleep:
+            dynamodb.return_value.batch_get_item.side_effect = responses
+            things = ThingTestClass._batch_load([t.uuid], 'tid')
+        self.assertEqual([item.uuid for item in things], [t.uuid])
+        sleep.assert_called_once_with(thing._BATCH_GET_BACKOFF)
+
+    def test_batch_load_gives_up(self):
+        tableName = environ['testing']
+        with mock.patch.object(thing, 'get_dynamodb') as dynamodb, mock.patch.object(thing.time, 'sleep') as sleep:
+            dynamodb.return_value.batch_get_item.return_value = {
+                'Responses': {}, 'UnprocessedKeys': {tableName: {'Keys': [{'uuid': 'uuid'}]}}
+            }
+            with self.assertRaises(RuntimeError):
+                ThingTestClass._batch_load(['uuid'], 'tid')
+        self.assertEqual(dynamodb.return_value.batch_get_item.call_count, thing._BATCH_GET_ATTEMPTS)
+        self.assertEqual(sleep.call_count, thing._BATCH_GET_ATTEMPTS - 1)
+
+    def test_tick_readonly(self):
+        t = ThingTestClass('', 'tid')
+        with mock.patch.object(thing, 'get_stepfunctions_client') as sfn, \
+                mock.patch.object(t._table, 'put_item') as put_item:
+            ThingTestClass._action({'action': 'tick', 'uuid': t.uuid, 'tid': 'tid'})
+        put_item.assert_not_called()
+        scheduled = json.loads(sfn.return_value.start_execution.call_args[1]['input'])
+        self.assertEqual(scheduled['delay_seconds'], 30)
+        self.assertEqual(scheduled['data']['action'], 'tick')
 
     def test_prohibited_sets(self):
         t = ThingTestClass('', 'tid')
@@ -123,4 +204,90 @@ Version: "2012-10-17"
         t = ThingTestClass('', 'tid')
         self.assertEqual(t.aspectName, 'ThingTestClass')
 
+    def test_allowed_actions(self):
+        actions = ThingTestClass._allowed_actions
+        self.assertIn('destroy', actions)
+        self.assertNotIn('aspect', actions)
+        with self.assertRaises(ValueError):
+            ThingTestClass._action({'action': 'callAspect', 'uuid': 'uuid'})
+        with self.assertRaises(ValueError):
+            ThingTestClass._action({'action': '_update_attr', 'uuid': 'uuid', 'data': {'name': 'x', 'value': 1}})
+
+    def test_get_aspect_class(self):
+        from aspects.landCreator import LandCreator
+        self.assertIs(thing.get_aspect_class('LandCreator'), LandCreator)
+
+    def test_preload_aspects(self):
+        with mock.patch.object(thing, '_KNOWN_ASPECTS', ('Location', 'Missing')):
+            with self.assertRaises(ImportError):
+                thing.preload_aspects()
+            # Still importing, so it's left for that module's own handler to preload
+            with mock.patch.dict('sys.modules', {'aspects.missing': mock.Mock()}):
+                thing.preload_aspects()
+
+
+class TestCall(unittest.TestCase):
+    def test_thenCall_chains_in_order(self):
+        c = thing.Call('tid', 'origin', 'target', 'Location', 'add_exit', direction='north')
+        c.thenCall('Land', 'first', '').thenCall('Land', 'second', '')
+        first = c.to_dict()['callback']
+        self.assertEqual(first['action'], 'first')
+        self.assertEqual(first['uuid'], 'origin')
+        self.assertEqual(first['callback']['action'], 'second')
+        self.assertNotIn('callback', first['callback'])
+
+    def test_batched(self):
+        with mock.patch.object(thing, 'get_sns_topic') as topic:
+            topic.return_value.meta.client.publish_batch.return_value = {'Successful': []}
+            with thing.Call.batched():
+                thing.Call('tid', '', 'one', 'Land', 'tick').now()
+                with thing.Call.batched():
+                    thing.Call('tid', '', 'two', 'Land', 'tick').now()
+                topic.return_value.meta.client.publish_batch.assert_not_called()
+        topic.return_value.publish.assert_not_called()
+        entries = topic.return_value.meta.client.publish_batch.call_args[1]['PublishBatchRequestEntries']
+        self.assertEqual([json.loads(e['Message'])['uuid'] for e in entries], ['one', 'two'])
+
+    def test_batched_retries_failures(self):
+        with mock.patch.object(thing, 'get_sns_topic') as topic:
+            publish_batch = topic.return_value.meta.client.publish_batch
+            publish_batch.side_effect = [
+                {'Failed': [{'Id': '1', 'Code': 'InternalError', 'SenderFault': False}]},
+                {'Successful': []}
+            ]
+            with thing.Call.batched():
+                thing.Call('tid', '', 'one', 'Land', 'tick').now()
+                thing.Call('tid', '', 'two', 'Land', 'tick').now()
+        retried = publish_batch.call_args[1]['PublishBatchRequestEntries']
+        self.assertEqual([json.loads(e['Message'])['uuid'] for e in retried], ['two'])
+
+    def test_batched_raises_on_failure(self):
+        with mock.patch.object(thing, 'get_sns_topic') as topic:
+            topic.return_value.meta.client.publish_batch.return_value = {
+                'Failed': [{'Id': '0', 'Code': 'InvalidParameter', 'SenderFault': True}]
+            }
+            with self.assertRaises(RuntimeError):
+                with thing.Call.batched():
+                    thing.Call('tid', '', 'one', 'Land', 'tick').now()
+
+    def test_batched_drops_on_error(self):
+        with mock.patch.object(thing, 'get_sns_topic') as topic:
+            with self.assertRaises(KeyError):
+                with thing.Call.batched():
+                    thing.Call('tid', '', 'one', 'Land', 'tick').now()
+                    raise KeyError('original')
+        topic.return_value.meta.client.publish_batch.assert_not_called()
+        topic.return_value.publish.assert_not_called()
+
+    def test_batched_splits_by_size(self):
+        with mock.patch.object(thing, 'get_sns_topic') as topic:
+            publish_batch = topic.return_value.meta.client.publish_batch
+            publish_batch.return_value = {'Successful': []}
+            with thing.Call.batched():
+                for uuid in ('one', 'two', 'three'):
+                    thing.Call('tid', '', uuid, 'Land', 'tick', padding='x' * 100000).now()
+        self.assertEqual(
+            [len(c[1]['PublishBatchRequestEntries']) for c in publish_batch.call_args_list], [2, 1]
+        )
+
 # TODO: Test aspect and all the eventing code (_sendEvent and callback and such)
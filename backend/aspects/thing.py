@@ -1,99 +1,224 @@
-import boto3
-from uuid import uuid4
-import json
-from os import environ
-from typing import Dict, Any
-from collections import UserDict
+from os import environ, urandom
+from typing import Dict, Any, FrozenSet, List, Optional
+from contextvars import ContextVar
 import logging
 import importlib
-import decimal
+import sys
+import copy
+import time
+from functools import lru_cache
+from contextlib import contextmanager
+from .awsClients import get_dynamodb, get_dynamodb_table, get_sns_topic, get_stepfunctions_client
+from .encoding import dumps
 
 EventType = Dict[str, Any]  # Actually needs to be json-able
 IdType = str  # This is a UUID cast to a str, but I want to identify it for typing purposes
 
+_KNOWN_ASPECTS = ('Location', 'Land', 'LandCreator')
+_ASPECT_REGISTRY: Dict[str, type] = {}  # Every Thing subclass, by name. They add themselves as they're defined
 
-def callable(func):
+
+def callable_action(func):
     def wrapper(*args, **kwargs):
-        logging.info("Calling {} with {}, {}".format(str(func), str(args), str(kwargs)))
+        if logging.getLogger().isEnabledFor(logging.INFO):
+            logging.info("Calling %s with %s, %s", func, args, kwargs)
         result = func(*args, **kwargs)
         assert(isinstance(result, dict) or result is None)
         return result
+    wrapper._is_action = True
     return wrapper
 
 
-class DecimalEncoder(json.JSONEncoder):
-    def default(self, obj):
-        if isinstance(obj, decimal.Decimal):
-            return int(obj)
-        return super(DecimalEncoder, self).default(obj)
+def readonly(func):
+    " Marks an action that doesn't change the item, so _action can skip saving it afterwards "
+    func._is_readonly = True
+    return func
+
+
+def _new_id() -> str:
+    " Ids are opaque, so 16 random bytes as hex - same shape as uuid4().hex without building a UUID "
+    return urandom(16).hex()
+
+
+@lru_cache(maxsize=None)
+def _arn(name: str) -> str:
+    " ARNs don't change for the life of the container, so only look them up once "
+    return environ[name]
+
+
+# Messages from Call.now() waiting to go out in a batch, when inside an _action
+_pendingPublishes: ContextVar[Optional[List[Dict]]] = ContextVar('pendingPublishes', default=None)
+_PUBLISH_BATCH_COUNT = 10  # SNS limits on a single publish_batch
+_PUBLISH_BATCH_BYTES = 256 * 1024
+_PUBLISH_ATTEMPTS = 3
+
+
+def _publishSize(entry: Dict) -> int:
+    " What SNS counts towards the batch payload limit - the message plus its attributes "
+    size = len(entry['Message'].encode())
+    for name, attr in entry['MessageAttributes'].items():
+        size += len(name.encode()) + len(attr['DataType'].encode()) + len(attr['StringValue'].encode())
+    return size
+
+
+def _publishBatch(topic, batch: List[Dict]) -> None:
+    " Publish one batch, retrying the entries that failed on the AWS side, and raise if any still fail "
+    for attempt in range(_PUBLISH_ATTEMPTS):
+        response = topic.meta.client.publish_batch(
+            TopicArn=topic.arn,
+            PublishBatchRequestEntries=[dict(Id=str(i), **entry) for i, entry in enumerate(batch)]
+        )
+        failed = response.get('Failed', [])
+        if not failed:
+            return
+        logging.warning("Failed to publish %d messages: %s", len(failed), failed)
+        if any(failure.get('SenderFault') for failure in failed):
+            break  # Sending the same thing again won't help
+        batch = [batch[int(failure['Id'])] for failure in failed]
+    raise RuntimeError("Failed to publish to {}: {}".format(topic.arn, failed))
 
 
-class Call(UserDict):
+class Call:
+    __slots__ = ('_originating_uuid', 'tid', 'aspect', 'uuid', 'action', 'data', 'callback', '_tail')
+
     def __init__(self, tid: str, originator: IdType, uuid: IdType, aspect: str, action: str, **kwargs):
-        super().__init__()
         self._originating_uuid = originator
-        self.data['tid'] = tid
-        self.data['aspect'] = aspect
-        self.data['uuid'] = uuid
-        self.data['action'] = action
-        self.data['data'] = kwargs
+        self.tid = tid
+        self.aspect = aspect
+        self.uuid = uuid
+        self.action = action
+        self.data = kwargs
+        self.callback: Optional[EventType] = None
+        self._tail: Optional[EventType] = None  # Last callback in the chain, so appends don't walk it
 
     def thenCall(self, aspect: str, action: str, uuid: IdType, **kwargs: Dict) -> 'Call':
         assert(self._originating_uuid)
         callback = {
-            'tid': self['tid'],
+            'tid': self.tid,
             'aspect': aspect,
             'action': action,
             'uuid': self._originating_uuid,
             'data': kwargs
         }
-        d = self.data
-        while 'callback' in d:
-            d = d['callback']
-        d['callback'] = callback
+        if self._tail is None:
+            self.callback = callback
+        else:
+            self._tail['callback'] = callback
+        self._tail = callback
         return self
 
+    def to_dict(self) -> EventType:
+        event = {
+            'tid': self.tid,
+            'aspect': self.aspect,
+            'uuid': self.uuid,
+            'action': self.action,
+            'data': self.data
+        }
+        if self.callback:
+            event['callback'] = self.callback
+        return event
+
     def now(self) -> None:
-        sns = boto3.resource('sns').Topic(environ['THING_TOPIC_ARN'])
-        logging.info(self.data)
-        return sns.publish(
-            Message=json.dumps(self.data, cls=DecimalEncoder),
-            MessageAttributes={
-                'aspect': {
-                    'DataType': 'String',
-                    'StringValue': self.data['aspect']
-                },
-                'action': {
-                    'DataType': 'String',
-                    'StringValue': self.data['action']
-                },
-                'uuid': {
-                    'DataType': 'String',
-                    'StringValue': self.data['uuid']
-                }
+        " Publishes immediately, or at the end of the current _action if we're inside one "
+        event = self.to_dict()
+        if logging.getLogger().isEnabledFor(logging.INFO):
+            logging.info("Sending %s", event)
+        publishArgs = {
+            'Message': dumps(event),
+            'MessageAttributes': {
+                'aspect': {'DataType': 'String', 'StringValue': self.aspect},
+                'action': {'DataType': 'String', 'StringValue': self.action},
+                'uuid': {'DataType': 'String', 'StringValue': self.uuid}
             }
-        )
+        }
+        pending = _pendingPublishes.get()
+        if pending is not None:
+            pending.append(publishArgs)
+            return None
+        return get_sns_topic('THING_TOPIC_ARN').publish(**publishArgs)
+
+    @staticmethod
+    @contextmanager
+    def batched():
+        " Hold now() publishes until the block exits, then send them with publish_batch - nests into an outer batch "
+        if _pendingPublishes.get() is not None:
+            yield
+            return
+        token = _pendingPublishes.set([])
+        try:
+            yield
+            Call.flush()
+        finally:
+            # If the block raised, drop what it queued - _action drops its deferred saves too, so don't announce them
+            dropped = _pendingPublishes.get()
+            if dropped:
+                logging.warning("Dropping %d messages queued before an error", len(dropped))
+            _pendingPublishes.reset(token)
+
+    @staticmethod
+    def flush() -> None:
+        " Publish everything queued up by now(), in batches within SNS's count and size limits "
+        pending = _pendingPublishes.get()
+        if not pending:
+            return
+        topic = get_sns_topic('THING_TOPIC_ARN')
+        entries, pending[:] = pending[:], []
+        batch: List[Dict] = []
+        batchSize = 0
+        for entry in entries:
+            size = _publishSize(entry)
+            if batch and (len(batch) == _PUBLISH_BATCH_COUNT or batchSize + size > _PUBLISH_BATCH_BYTES):
+                _publishBatch(topic, batch)
+                batch, batchSize = [], 0
+            batch.append(entry)
+            batchSize += size
+        _publishBatch(topic, batch)
 
     def after(self, seconds: int = 0) -> None:
-        sfn = boto3.client('stepfunctions')
-        return sfn.start_execution(
-            stateMachineArn=environ['MESSAGE_DELAYER_ARN'],
-            input=json.dumps({
+        return get_stepfunctions_client().start_execution(
+            stateMachineArn=_arn('MESSAGE_DELAYER_ARN'),
+            input=dumps({
                 'delay_seconds': seconds,
-                'data': self.data
-            }, cls=DecimalEncoder)
+                'data': self.to_dict()
+            })
         )
 
 
-class Thing(UserDict):
+def _dispatch_callback(event: EventType, response: EventType) -> None:
+    " Relay the response of an action on to the callback, if the event asked for one "
+    c = event.get('callback')
+    if not c:
+        return
+    data = c['data']
+    data.update(response or {})
+    Call(c['tid'], '', c['uuid'], c['aspect'], c['action'], **data).now()
+
+
+_BATCH_GET_ATTEMPTS = 5
+_BATCH_GET_BACKOFF = 0.05  # Seconds before the first retry of UnprocessedKeys, doubling each time
+
+
+class Thing:
     " Thing objects have state (stored in dynamo) and know how to event and callback "
     _tableName: str = ''  # Set this in the subclass
+    _allowed_actions: FrozenSet[str] = frozenset()  # The @callable_action methods, the only ones an event may invoke
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        _ASPECT_REGISTRY[cls.__name__] = cls
+        names = {name for c in cls.__mro__ for name in vars(c) if not name.startswith('_')}
+        cls._allowed_actions = frozenset(
+            name for name in names if getattr(getattr(cls, name), '_is_action', False)
+        )
 
     def __init__(self, uuid: IdType = None, tid: str = None):
-        super().__init__()
         assert(self._tableName)
-        self._tid: str = tid or str(uuid4())
-        self.data['uuid'] = uuid or str(uuid4())
+        self.data: Dict = {}
+        self._saved: Dict = {}  # What dynamo last saw, so unchanged items needn't be written back
+        self._deferSaves = False  # Set while in _action, which does a single _flush at the end
+        self._tid: str = tid or _new_id()
+        self.data['uuid'] = uuid or _new_id()
         if uuid:
             self._load(uuid)
         else:
@@ -103,34 +228,33 @@ class Thing(UserDict):
 
     @property
     def tickDelay(self):
-        if 'tick_delay' not in self.data:
-            self.data['tick_delay'] = 30
-            self._save()
-        return self.data['tick_delay']
+        return self.data.get('tick_delay', 30)
 
     @property
     def _table(self):
-        return boto3.resource('dynamodb').Table(environ[self._tableName])
+        return get_dynamodb_table(self._tableName)
 
-    @callable
+    @callable_action
     def create(self) -> None:
         self._save()
 
-    @callable
+    @callable_action
     def destroy(self) -> None:
         self._table.delete_item(Key={'uuid': self.uuid})
-        logging.info("{} has been destroyed".format(self.uuid))
+        logging.info("%s has been destroyed", self.uuid)
 
-    @callable
+    @readonly
+    @callable_action
     def tick(self) -> None:
         self.schedule_next_tick()
 
-    @callable
+    @readonly
+    @callable_action
     def schedule_next_tick(self) -> None:
-        Call(str(uuid4()), self.uuid, self.uuid, self.aspectName, 'tick').after(seconds=self.tickDelay)
+        Call(_new_id(), self.uuid, self.uuid, self.aspectName, 'tick').after(seconds=self.tickDelay)
 
     def aspect(self, aspect: str) -> 'Thing':
-        return getattr(importlib.import_module(aspect.lower()), aspect)(self.uuid, self.tid)
+        return get_aspect_class(aspect)(self.uuid, self.tid)
 
     @property
     def aspectName(self) -> str:
@@ -140,9 +264,82 @@ class Thing(UserDict):
         self.data: Dict = self._table.get_item(Key={'uuid': uuid}).get('Item', {})
         if not self.data:
             raise KeyError("load for non-existent item {}".format(uuid))
+        self._saved = copy.deepcopy(self.data)
+
+    @classmethod
+    def _from_item(cls, item: Dict, tid: str = None) -> 'Thing':
+        " Build from an item already fetched from dynamo, rather than loading it again "
+        thing = cls.__new__(cls)
+        thing._tid = tid or _new_id()
+        thing.data = item
+        thing._saved = copy.deepcopy(item)
+        thing._deferSaves = False
+        return thing
+
+    @classmethod
+    def _batch_load(cls, uuids: List[IdType], tid: str = None) -> List['Thing']:
+        " Load many items with batch_get_item, 100 keys per request, instead of a get_item each "
+        tableName = get_dynamodb_table(cls._tableName).name
+        things = []
+        for i in range(0, len(uuids), 100):
+            request = {tableName: {'Keys': [{'uuid': uuid} for uuid in uuids[i:i + 100]]}}
+            for attempt in range(_BATCH_GET_ATTEMPTS):
+                if attempt:
+                    time.sleep(_BATCH_GET_BACKOFF * 2 ** (attempt - 1))  # Unprocessed usually means throttled
+                response = get_dynamodb().batch_get_item(RequestItems=request)
+                things.extend(cls._from_item(item, tid) for item in response['Responses'].get(tableName, []))
+                request = response.get('UnprocessedKeys')
+                if not request:
+                    break
+            else:
+                raise RuntimeError("Still unprocessed after {} attempts: {}".format(_BATCH_GET_ATTEMPTS, request))
+        return things
 
     def _save(self) -> None:
-        self._table.put_item(Item=self.data)
+        if not self._deferSaves:
+            self._flush()
+
+    def _flush(self) -> None:
+        if self._dirty:
+            self._table.put_item(Item=self._item())
+            self._saved = copy.deepcopy(self.data)
+
+    def _item(self) -> Dict:
+        " What gets written to dynamo. None means the attribute isn't set "
+        return {key: value for key, value in self.data.items() if value is not None}
+
+    @classmethod
+    def _flush_all(cls, things: List['Thing']) -> None:
+        " Write any changed things with batch_write_item, 25 to a request, rather than a put_item each "
+        with get_dynamodb_table(cls._tableName).batch_writer() as batch:
+            for thing in things:
+                if thing._dirty:
+                    batch.put_item(Item=thing._item())
+                    thing._saved = copy.deepcopy(thing.data)
+
+    def _update_attr(self, name: str, value: Any) -> None:
+        " Write a single attribute with update_item, rather than putting the whole item "
+        self.data[name] = value
+        if self._deferSaves:
+            return
+        if value is None:
+            self._table.update_item(
+                Key={'uuid': self.uuid},
+                UpdateExpression='REMOVE #attr',
+                ExpressionAttributeNames={'#attr': name}
+            )
+        else:
+            self._table.update_item(
+                Key={'uuid': self.uuid},
+                UpdateExpression='SET #attr = :value',
+                ExpressionAttributeNames={'#attr': name},
+                ExpressionAttributeValues={':value': value}
+            )
+        self._saved[name] = copy.deepcopy(value)
+
+    @property
+    def _dirty(self) -> bool:
+        return self.data != self._saved
 
     @property
     def tid(self) -> str:
@@ -154,19 +351,22 @@ class Thing(UserDict):
 
     @classmethod
     def _action(cls, event: EventType):  # This is not state related, this is the entry point for the object
-        assert(not event['action'].startswith('_'))
+        action = event['action']
+        if action not in cls._allowed_actions:  # Not an assert, this has to hold under -O too
+            raise ValueError("{} is not an action on {}".format(action, cls.__name__))
         uuid = event.get('uuid')  # Allowing for no uuid for creation
         if not uuid:
-            assert(event['action'] == 'create')
-        tid = str(event.get('tid') or uuid4())
-        actor = cls(uuid, tid)
-        response: EventType = getattr(actor, event['action'])(**event.get('data', {}))
-        if event.get('callback'):
-            c = event['callback']
-            data = c['data']
-            data.update(response or {})
-            Call(c['tid'], '', c['uuid'], c['aspect'], c['action'], **data).now()
-        actor._save()
+            assert(action == 'create')
+        tid = str(event.get('tid') or _new_id())
+        with Call.batched():
+            actor = cls(uuid, tid)
+            method = getattr(actor, action)
+            isReadonly = getattr(method, '_is_readonly', False)
+            actor._deferSaves = not isReadonly
+            response: EventType = method(**event.get('data', {}))
+            _dispatch_callback(event, response)
+            if not isReadonly:
+                actor._flush()
 
     # Below here are questionable for this class
 
@@ -177,9 +377,8 @@ class Thing(UserDict):
             'actor_uuid': self.data['uuid']
         }
         sendEvent.update(event or {})
-        topic = boto3.resource('sns').Topic(environ['THING_TOPIC_ARN'])
-        return topic.publish(
-            Message=json.dumps(sendEvent),
+        return get_sns_topic('THING_TOPIC_ARN').publish(
+            Message=dumps(sendEvent),
             MessageStructure='json'
         )
 
@@ -192,3 +391,22 @@ class Thing(UserDict):
 
     def createAspect(self, aspect: str) -> None:
         self.call(self.uuid, aspect, 'create')
+
+
+def get_aspect_class(aspect: str) -> type:
+    " Aspect classes live in aspects/<aspectName>.py, eg. LandCreator in aspects/landCreator.py "
+    if aspect not in _ASPECT_REGISTRY:
+        importlib.import_module(_aspect_module(aspect))
+    return _ASPECT_REGISTRY[aspect]
+
+
+def _aspect_module(aspect: str) -> str:
+    return '{}.{}{}'.format(__package__, aspect[0].lower(), aspect[1:])
+
+
+def preload_aspects() -> None:
+    " Import the known aspects during Lambda init rather than on the first event that needs them "
+    if any(aspect not in _ASPECT_REGISTRY and _aspect_module(aspect) in sys.modules for aspect in _KNOWN_ASPECTS):
+        return  # An aspect is part way through importing - it preloads the rest when it gets to its own handler
+    for aspect in _KNOWN_ASPECTS:
+        get_aspect_class(aspect)